@@ -1,4 +0,0 @@
-from logging.config import dictConfig
-from .defs import LOGGING_CONFIG
-
-dictConfig(LOGGING_CONFIG)
@@ -1,9 +1,8 @@
 from pathlib import Path
 import argparse
-from pyegt.defs import MODEL_LIST, REGIONS
+from logging.config import dictConfig
 
 import logging as L
-from .pipeline import Pipeline
 
 def cli():
     """
@@ -12,19 +11,48 @@ def cli():
     parser = argparse.ArgumentParser(prog='pdgsubsurface', description='Convert radar files (currently only GSSI DZT format) to Cesium tilesets.')
     parser.add_argument('-a', '--archive', action='store_true', help='Whether to archive the input dataset')
     parser.add_argument('-z', '--translate_z', type=float, default=0.0, help='Float translation for z values')
-    parser.add_argument('-g', '--from_geoid', choices=MODEL_LIST, default=None, help='The geoid, tidal, or geopotential model to translate from')
-    parser.add_argument('-r', '--geoid_region', choices=REGIONS, default=REGIONS[0], help='The NGS region (https://vdatum.noaa.gov/docs/services.html#step140)')
-    parser.add_argument('-f', '--file', type=str, required=True, help='The file to process')
+    parser.add_argument('-g', '--from_geoid', default=None, help='The geoid, tidal, or geopotential model to translate from (see pyegt.defs.MODEL_LIST)')
+    parser.add_argument('-r', '--geoid_region', default=None, help='The NGS region (https://vdatum.noaa.gov/docs/services.html#step140)')
+    parser.add_argument('-o', '--output_dir', type=str, required=True, help='The directory to write the tileset to')
+    parser.add_argument('-f', '--files', type=str, nargs='+', required=True, help='The file(s) to process')
 
     args = parser.parse_args()
-    p = Path(args.file)
-    if not p.is_file():
-        L.error('No file at %s' % (p))
-        exit(1)
+    from .defs import LOGGING_CONFIG
+    dictConfig(LOGGING_CONFIG)
 
-    p = Pipeline(f=args.file,
+    # validate against pyegt only when geoid options are used, so that
+    # --help and argument errors do not pay for importing it
+    if (args.from_geoid is not None) or (args.geoid_region is not None):
+        from pyegt.defs import MODEL_LIST, REGIONS
+        if (args.from_geoid is not None) and (args.from_geoid not in MODEL_LIST):
+            parser.error('argument -g/--from_geoid: invalid choice: %r (choose from %s)' % (args.from_geoid, ', '.join(MODEL_LIST)))
+        if (args.geoid_region is not None) and (args.geoid_region not in REGIONS):
+            parser.error('argument -r/--geoid_region: invalid choice: %r (choose from %s)' % (args.geoid_region, ', '.join(REGIONS)))
+
+    files = [Path(f) for f in args.files]
+    for p in files:
+        if not p.is_file():
+            L.error('No file at %s', p)
+            raise SystemExit(1)
+
+    # check every file before processing so that one bad line does not
+    # abort the batch after the others have been read
+    from .utils import validate_dzt
+    for p in files:
+        try:
+            validate_dzt(p)
+        except (OSError, ValueError) as e:
+            L.error('%s', e)
+            raise SystemExit(1)
+
+    from .pipeline import Pipeline
+    kwargs = {}
+    if args.geoid_region is not None:
+        kwargs['geoid_region'] = args.geoid_region
+    p = Pipeline(gpr_files=files,
+                 output_dir=args.output_dir,
                  archive=args.archive,
                  translate_z=args.translate_z,
                  from_geoid=args.from_geoid,
-                 geoid_region=args.geoid_region)
-    p.run()
\ No newline at end of file
+                 **kwargs)
+    p.process()
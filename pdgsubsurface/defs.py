@@ -13,5 +13,14 @@ HELP_TXT = '''
 MOD_LOC = Path(__file__).parent.absolute()
 
 LOGCONFIG = MOD_LOC.joinpath('log/config.json')
-with open(LOGCONFIG, 'r') as lc:
-    LOGGING_CONFIG = json.load(lc)
+
+def __getattr__(name: str):
+    """
+    Load ``LOGGING_CONFIG`` from :py:data:`LOGCONFIG` on first access
+    rather than at import time.
+    """
+    if name == 'LOGGING_CONFIG':
+        with open(LOGCONFIG, 'r') as lc:
+            globals()['LOGGING_CONFIG'] = json.load(lc)
+        return globals()['LOGGING_CONFIG']
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
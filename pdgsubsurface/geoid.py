@@ -1,16 +1,21 @@
 from typing import Union, Literal
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from pyproj import CRS, Transformer
 from logging import getLogger
 
 from pyegt.height import HeightModel
 from pyegt.utils import model_search
 
+_model_search = lru_cache(maxsize=128)(model_search)
+
 def use_model(user_vrs: Union[str, Literal[None]]=None,
                las_vrs: Union[str, Literal[None]]=None, # overrides user_vrs.
                # consequently implies we trust file headers;
                # this is done to support projects with multiple CRS
                # and to enforce correct CRS info in database
-               ) -> str:
+               ) -> Union[str, Literal[None]]:
     """
     Get the geoid, tidal, or geopotential model
     in order to calculate ellipsoid height.
@@ -55,54 +60,72 @@ def use_model(user_vrs: Union[str, Literal[None]]=None,
             # 1. matched las_vrs / matched user_vrs -> las_vrs
             # 2. matched las_vrs / unmatched user_vrs -> las_vrs
             # 3. matched las_vrs / empty user_vrs -> las_vrs
-            # 4. empty las_vrs / empty user_vrs -> 0
+            # 4. empty las_vrs / empty user_vrs -> None
             # 5. empty las_vrs / matched user_vrs -> user_vrs
-            # 6. empty las_vrs / unmatched user_vrs -> exit(1)
-            # 7. unmatched las_vrs / empty user_vrs -> exit(1)
-            # 8. unmatched las_vrs / matched user_vrs -> exit(1) # maybe in the future we have a geoid_override setting where this will execute
-            # 9. unmatched las_vrs / unmatched user_vrs -> exit(1)
+            # 6. empty las_vrs / unmatched user_vrs -> SystemExit(1)
+            # 7. unmatched las_vrs / empty user_vrs -> SystemExit(1)
+            # 8. unmatched las_vrs / matched user_vrs -> SystemExit(1) # maybe in the future we have a geoid_override setting where this will execute
+            # 9. unmatched las_vrs / unmatched user_vrs -> SystemExit(1)
 
 
     :param user_vrs: The user-specified geoid model to convert from if none is found in the file header
-    :return: The model name to use for lookup
-    :rtype: str
+    :return: The model name to use for lookup, or ``None`` if no VRS was given
+    :rtype: str or None
+    :raises SystemExit: If a given VRS cannot be matched (scenarios 6-9)
     """
     L = getLogger(__name__)
     vrs = None
-    L.debug(f'user_vrs={user_vrs}, las_vrs={las_vrs}')
+    L.debug('user_vrs=%s, las_vrs=%s', user_vrs, las_vrs)
     if las_vrs:
         # override user value with detected VRS
-        vrs = model_search(las_vrs)
-        L.debug(f'after model_search(las_vrs): vrs={vrs}')
+        vrs = _model_search(las_vrs)
+        L.debug('after model_search(las_vrs): vrs=%s', vrs)
         if user_vrs and vrs:
             # scenarios 1 and 2
-            L.info('User value of "%s" will be overridden by detected VRS "%s"' % (user_vrs, vrs))
+            L.info('User value of "%s" will be overridden by detected VRS "%s"', user_vrs, vrs)
         if user_vrs and (not vrs):
             # scenarios 8 and 9
-            L.error('No vertical reference system matching "%s" found' % (user_vrs))
-            exit(1)
+            L.error('No vertical reference system matching "%s" found', user_vrs)
+            raise SystemExit(1)
         if not user_vrs:
             # scenario 3
             pass
         if (not user_vrs) and (not vrs):
             # scenario 7
-            L.error('No vertical reference system matching "%s" found' % (las_vrs))
+            L.error('No vertical reference system matching "%s" found', las_vrs)
+            raise SystemExit(1)
     else:
         if not user_vrs:
             # scenario 4
-            return 0
+            return None
         else:
-            vrs = model_search(user_vrs)
-            L.debug(f'after model_search(user_vrs): vrs={vrs}')
+            vrs = _model_search(user_vrs)
+            L.debug('after model_search(user_vrs): vrs=%s', vrs)
             if vrs:
                 # scenario 5
-                L.info('VRS found: %s (user-specified)' % (vrs))
+                L.info('VRS found: %s (user-specified)', vrs)
             else:
                 # scenario 6
-                L.error('Could not find VRS matching value "%s"' % (user_vrs))
-                exit(1)
+                L.error('Could not find VRS matching value "%s"', user_vrs)
+                raise SystemExit(1)
     return vrs
 
+@lru_cache(maxsize=64)
+def _get_transformer(from_crs: Union[CRS, int, str]) -> Transformer:
+    """
+    Build (once per input CRS) the transformer from ``from_crs`` to WGS84.
+    Transformer construction is far more expensive than the transformation
+    itself, so the result is cached for reuse across calls.
+
+    :param from_crs: The projected coordinate reference system to convert from
+    :type from_crs: pyproj.crs.CRS or int or str
+    :return: The transformer to WGS84
+    :rtype: pyproj.Transformer
+    """
+    crs = from_crs if isinstance(from_crs, CRS) else CRS.from_user_input(from_crs)
+    wgs84 = CRS.from_epsg(4326)
+    return Transformer.from_crs(crs_from=crs, crs_to=wgs84)
+
 def crs_to_wgs84(x: Union[str, int, float], y: Union[str, int, float], from_crs: Union[CRS, int, str]):
     """
     Convert grid coordinates to cartographic (lat/lon) in order to use the
@@ -117,24 +140,49 @@ def crs_to_wgs84(x: Union[str, int, float], y: Union[str, int, float], from_crs:
     :return: The lat and long position equivalent to the X and Y position in the input CRS
     :rtype: tuple(float, float)
     """
-    if type(from_crs) == int:
-        crs = CRS.from_epsg(from_crs)
-    elif type(from_crs) == CRS:
-        crs = from_crs
-    elif type(from_crs) == str:
-        if "AUTHORITY" in from_crs:
-            crs = CRS.from_wkt(from_crs)
-        else:
-            crs = CRS.from_string(from_crs)
-    wgs84 = CRS.from_epsg(4326)
-    t = Transformer.from_crs(crs_from=crs, crs_to=wgs84)
+    t = _get_transformer(from_crs)
     return t.transform(xx=float(x), yy=float(y))
 
+def crs_to_wgs84_batch(xs, ys, from_crs: Union[CRS, int, str]):
+    """
+    Convert arrays of grid coordinates (e.g. a GPS track with one position
+    per GPR trace) to cartographic (lat/lon) in a single call. This is much
+    faster than calling :py:func:`crs_to_wgs84` once per point.
+
+    :param xs: The X-coordinates to convert to longitude
+    :type xs: list or numpy.ndarray
+    :param ys: The Y-coordinates to convert to latitude
+    :type ys: list or numpy.ndarray
+    :param from_crs: The projected coordinate reference system to convert from
+    :type from_crs: pyproj.crs.CRS or int or str
+    :return: The lat and long positions equivalent to the X and Y positions in the input CRS
+    :rtype: tuple(numpy.ndarray, numpy.ndarray)
+    :raises ValueError: if ``xs`` and ``ys`` differ in shape
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if xs.shape != ys.shape:
+        raise ValueError('Coordinate arrays differ in shape: %s and %s' % (xs.shape, ys.shape))
+    t = _get_transformer(from_crs)
+    return t.transform(xx=xs, yy=ys)
+
+@lru_cache(maxsize=4096)
+def _height_model(lat: float, lon: float, model: str, region: str) -> HeightModel:
+    """
+    Cached :py:class:`pyegt.height.HeightModel` lookup. Callers should round
+    ``lat`` and ``lon`` so that nearby points share a cache entry.
+    """
+    return HeightModel(lat=lat, lon=lon, from_model=model, region=region)
+
 def get_adjustment(lat: float, lon: float, model=str, region=str):
     """
     Get the modeled height of a specified location and a specified geoid or
     tidal model from :py:class:`pyegt.height.HeightModel`.
 
+    Coordinates are rounded to 5 decimal places (about 1 m) and lookups are
+    cached, since geoid heights vary smoothly and repeated queries for nearby
+    GPR traces would otherwise each go through pyegt.
+
     :param float lat: Decimal latitude
     :param float lon: Decimal longitude
     :param str model: The geoid or tidal model to query the height of
@@ -142,4 +190,43 @@ def get_adjustment(lat: float, lon: float, model=str, region=str):
     :return: The ellipsoid height of the given geoid model at the given location
     :rtype: pyegt.height.HeightModel
     """
-    return HeightModel(lat=lat, lon=lon, from_model=model, region=region)
+    return _height_model(round(float(lat), 5), round(float(lon), 5), model, region)
+
+def get_adjustments_grid(lats, lons, model: str, region: str,
+                         cell_deg: float=0.001, workers: int=1) -> np.ndarray:
+    """
+    Get the modeled heights for a whole track (e.g. one position per GPR
+    trace). Positions are snapped to a grid of ``cell_deg`` degrees (the
+    default is roughly 100 m) and :py:class:`pyegt.height.HeightModel` is
+    queried once per occupied cell, since geoid heights vary smoothly.
+
+    :param lats: Decimal latitudes
+    :type lats: list or numpy.ndarray
+    :param lons: Decimal longitudes
+    :type lons: list or numpy.ndarray
+    :param str model: The geoid or tidal model to query the height of
+    :param str region: The geoid or tidal region (for options, see :py:data:`pyegt.defs.REGION`)
+    :param float cell_deg: The grid cell size in decimal degrees
+    :param int workers: Number of threads to query cells with (lookups may be network-bound)
+    :return: The height model of each input position
+    :rtype: numpy.ndarray of pyegt.height.HeightModel
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if lats.shape != lons.shape:
+        raise ValueError('Latitude and longitude arrays differ in shape: %s and %s' % (lats.shape, lons.shape))
+    cells = np.stack((np.rint(lats.ravel() / cell_deg),
+                      np.rint(lons.ravel() / cell_deg)), axis=1).astype(np.int64)
+    unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+    centers = [(round(float(i * cell_deg), 9), round(float(j * cell_deg), 9))
+               for i, j in unique_cells]
+    def lookup(center):
+        return _height_model(center[0], center[1], model, region)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            heights = list(ex.map(lookup, centers))
+    else:
+        heights = [lookup(c) for c in centers]
+    cell_heights = np.empty(len(heights), dtype=object)
+    cell_heights[:] = heights
+    return cell_heights[inverse.ravel()].reshape(lats.shape)
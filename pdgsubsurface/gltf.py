@@ -0,0 +1,441 @@
+import json
+import zlib
+import struct
+from typing import Union
+import numpy as np
+
+# glTF accessor component types
+SHORT = 5122
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+
+# glTF bufferView targets
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+QUANT_MAX = 32767
+
+# WGS84 ellipsoid semi-major axis (m) and first eccentricity squared
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+# largest texture edge that WebGL implementations can be relied on to load
+MAX_TEXTURE_SIZE = 8192
+
+# grayscale RGBA lookup table used to paint radargrams
+GRAY_LUT = np.empty((256, 4), dtype=np.uint8)
+GRAY_LUT[:, :3] = np.arange(256, dtype=np.uint8)[:, None]
+GRAY_LUT[:, 3] = 255
+
+def center_samples(radargram: np.ndarray) -> np.ndarray:
+    """
+    Convert raw radar samples to zero-centered ``float32``. DZT files store
+    8- and 16-bit samples as unsigned offset-binary, so ``2**(bits-1)`` is
+    subtracted from unsigned data. The result is always a copy, so it may be
+    modified in place without touching the caller's array.
+
+    :param numpy.ndarray radargram: Radar profile of shape (samples, traces)
+    :return: The zero-centered samples
+    :rtype: numpy.ndarray
+    """
+    data = np.array(radargram, dtype=np.float32)
+    if np.issubdtype(radargram.dtype, np.unsignedinteger):
+        data -= 2 ** (radargram.dtype.itemsize * 8 - 1)
+    return data
+
+def agc(radargram: np.ndarray, window: int=64) -> np.ndarray:
+    """
+    Apply automatic gain control: divide each sample by the mean amplitude
+    of a ``window``-sample neighbourhood along the sample (time) axis.
+    The rolling mean is computed with a cumulative sum, so cost does not
+    depend on window size. Temporary memory is proportional to the input, so
+    large profiles should be passed in slices of traces (see
+    :py:func:`radargram_image`).
+
+    :param numpy.ndarray radargram: Radar profile of shape (samples, traces)
+    :param int window: The length of the gain window in samples
+    :return: The gained radargram
+    :rtype: numpy.ndarray
+    """
+    data = center_samples(radargram)
+    n = data.shape[0]
+    csum = np.zeros((n + 1,) + data.shape[1:], dtype=np.float64)
+    np.cumsum(np.abs(data), axis=0, out=csum[1:])
+    lo = np.clip(np.arange(n) - window // 2, 0, n)
+    hi = np.clip(np.arange(n) + window // 2 + 1, 0, n)
+    mean = (csum[hi] - csum[lo]) / (hi - lo).reshape((-1,) + (1,) * (data.ndim - 1))
+    mean[mean == 0] = 1.0
+    data /= mean
+    return data
+
+def _bin_starts(n: int, n_out: int) -> np.ndarray:
+    """
+    Start index of each of ``n_out`` near-equal bins over ``n`` elements.
+    """
+    bins = np.arange(n) * n_out // n
+    return np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+
+def radargram_image(radargram: np.ndarray, window: int=64, max_size: int=MAX_TEXTURE_SIZE,
+                    chunk: int=1024, lut: Union[np.ndarray, None]=None) -> np.ndarray:
+    """
+    Create the RGBA texture for a radar profile: apply :py:func:`agc`,
+    average traces and samples down so neither image edge exceeds
+    ``max_size``, then :py:func:`colormap` the result.
+
+    Traces are processed ``chunk`` at a time, so memory use is bounded by the
+    chunk and the output image rather than the size of the profile (which may
+    be a memory map, see :py:func:`pdgsubsurface.utils.memmap_dzt`).
+
+    :param numpy.ndarray radargram: Radar profile of shape (samples, traces)
+    :param int window: The length of the gain window in samples
+    :param int max_size: The largest allowed image width or height in pixels
+    :param int chunk: The number of traces to process at a time
+    :param lut: Color lookup table of shape (256, 4) (default: :py:data:`GRAY_LUT`)
+    :type lut: numpy.ndarray or None
+    :return: The RGBA image
+    :rtype: numpy.ndarray of shape (height, width, 4) and dtype uint8
+    """
+    n_samples, n_traces = radargram.shape
+    width = min(n_traces, max_size)
+    cols = np.arange(n_traces) * width // n_traces
+    sums = np.zeros((n_samples, width), dtype=np.float32)
+    counts = np.zeros(width, dtype=np.int64)
+    for a in range(0, n_traces, chunk):
+        c = cols[a:a + chunk]
+        starts = np.flatnonzero(np.r_[True, c[1:] != c[:-1]])
+        gained = agc(radargram[:, a:a + chunk], window)
+        sums[:, c[starts]] += np.add.reduceat(gained, starts, axis=1)
+        counts[c[starts]] += np.diff(np.r_[starts, len(c)])
+    img = sums / counts
+    if n_samples > max_size:
+        starts = _bin_starts(n_samples, max_size)
+        img = np.add.reduceat(img, starts, axis=0) / np.diff(np.r_[starts, n_samples])[:, None]
+    return colormap(img, lut=GRAY_LUT if lut is None else lut)
+
+def colormap(radargram: np.ndarray, vmin: Union[float, None]=None,
+             vmax: Union[float, None]=None, lut: np.ndarray=GRAY_LUT) -> np.ndarray:
+    """
+    Map a radargram to an RGBA image in a single vectorized pass: clip to
+    ``[vmin, vmax]``, scale to ``uint8`` and gather colors from ``lut``.
+
+    :param numpy.ndarray radargram: Radar profile of shape (samples, traces)
+    :param vmin: Value mapped to the first LUT entry (default: data minimum)
+    :type vmin: float or None
+    :param vmax: Value mapped to the last LUT entry (default: data maximum)
+    :type vmax: float or None
+    :param numpy.ndarray lut: Color lookup table of shape (256, 4)
+    :return: The RGBA image
+    :rtype: numpy.ndarray of shape (samples, traces, 4) and dtype uint8
+    """
+    vmin = float(np.min(radargram)) if vmin is None else vmin
+    vmax = float(np.max(radargram)) if vmax is None else vmax
+    scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+    normalized = ((np.clip(radargram, vmin, vmax) - vmin) * scale).astype(np.uint8)
+    return lut[normalized]
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """
+    Encode an RGBA image as PNG.
+
+    :param numpy.ndarray rgba: Image of shape (height, width, 4) and dtype uint8
+    :return: The PNG file contents
+    :rtype: bytes
+    """
+    h, w = rgba.shape[:2]
+    # each scanline is prefixed with filter type 0 (none)
+    raw = np.zeros((h, w * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(h, w * 4)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw.tobytes()))
+            + chunk(b'IEND', b''))
+
+def geodetic_to_ecef(lats, lons, heights) -> np.ndarray:
+    """
+    Convert WGS84 geodetic coordinates to earth-centered, earth-fixed (ECEF)
+    coordinates, the frame 3D Tiles places content in.
+
+    :param lats: Decimal latitudes
+    :type lats: list or numpy.ndarray
+    :param lons: Decimal longitudes
+    :type lons: list or numpy.ndarray
+    :param heights: Ellipsoid heights in meters
+    :type heights: list or numpy.ndarray
+    :return: ECEF positions in meters
+    :rtype: numpy.ndarray of shape (N, 3)
+    """
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    h = np.asarray(heights, dtype=np.float64)
+    sin_lat = np.sin(lat)
+    n = WGS84_A / np.sqrt(1.0 - WGS84_E2 * sin_lat ** 2)
+    return np.stack(((n + h) * np.cos(lat) * np.cos(lon),
+                     (n + h) * np.cos(lat) * np.sin(lon),
+                     (n * (1.0 - WGS84_E2) + h) * sin_lat), axis=-1)
+
+def curtain_positions(lats, lons, heights, depth: float) -> np.ndarray:
+    """
+    Build the ECEF vertex positions of a vertical "curtain" hanging below a
+    GPR track: one vertex at the surface and one at ``depth`` below it for
+    each trace.
+
+    :param lats: The latitudes of the traces
+    :type lats: list or numpy.ndarray
+    :param lons: The longitudes of the traces
+    :type lons: list or numpy.ndarray
+    :param heights: The surface ellipsoid heights of the traces
+    :type heights: list or numpy.ndarray
+    :param float depth: The depth of the profile below the surface
+    :return: ECEF vertex positions, interleaved top/bottom per trace
+    :rtype: numpy.ndarray of shape (2 * n_traces, 3)
+    """
+    heights = np.asarray(heights, dtype=np.float64)
+    pos = np.empty((2 * len(heights), 3), dtype=np.float64)
+    pos[0::2] = geodetic_to_ecef(lats, lons, heights)
+    pos[1::2] = geodetic_to_ecef(lats, lons, heights - depth)
+    return pos
+
+def ecef_to_gltf(pos: np.ndarray) -> np.ndarray:
+    """
+    Reorder Z-up ECEF(-relative) positions into glTF's Y-up axes as
+    ``(x, z, -y)``. 3D Tiles rotates glTF content back to Z-up when loading
+    it.
+
+    :param numpy.ndarray pos: Positions of shape (N, 3)
+    :return: The positions in glTF axes
+    :rtype: numpy.ndarray of shape (N, 3)
+    """
+    return np.stack((pos[:, 0], pos[:, 2], -pos[:, 1]), axis=-1)
+
+def curtain_indices(n_traces: int) -> np.ndarray:
+    """
+    Triangulate a curtain built by :py:func:`curtain_positions`, two
+    triangles per pair of neighbouring traces. Indices are ``uint16`` when the
+    vertex count allows it and ``uint32`` otherwise.
+
+    :param int n_traces: The number of traces in the profile
+    :return: The flat triangle index list
+    :rtype: numpy.ndarray
+    """
+    dtype = np.uint16 if 2 * n_traces <= 65535 else np.uint32
+    top = np.arange(0, 2 * (n_traces - 1), 2, dtype=dtype)
+    tris = np.empty((n_traces - 1, 6), dtype=dtype)
+    tris[:, 0] = top
+    tris[:, 1] = top + 1
+    tris[:, 2] = top + 2
+    tris[:, 3] = top + 2
+    tris[:, 4] = top + 1
+    tris[:, 5] = top + 3
+    return tris.ravel()
+
+def curtain_uvs(n_traces: int) -> np.ndarray:
+    """
+    Texture coordinates for a curtain built by :py:func:`curtain_positions`,
+    stretching the radargram image across the whole track.
+
+    :param int n_traces: The number of traces in the profile
+    :return: Normalized ``uint16`` texture coordinates
+    :rtype: numpy.ndarray of shape (2 * n_traces, 2)
+    """
+    uv = np.empty((2 * n_traces, 2), dtype=np.uint16)
+    u = np.linspace(0, 65535, n_traces).astype(np.uint16)
+    uv[0::2, 0] = uv[1::2, 0] = u
+    uv[0::2, 1] = 0
+    uv[1::2, 1] = 65535
+    return uv
+
+def quantize_positions(pos: np.ndarray):
+    """
+    Quantize float positions to ``int16`` relative to their bounding box
+    (see ``KHR_mesh_quantization``).
+
+    :param numpy.ndarray pos: Positions of shape (N, 3)
+    :return: The quantized positions and the column-major node matrix that maps them back to the original coordinates
+    :rtype: tuple(numpy.ndarray, list)
+    """
+    bbox_min = pos.min(axis=0)
+    extent = pos.max(axis=0) - bbox_min
+    extent[extent == 0] = 1.0
+    q = np.rint((pos - bbox_min) / extent * QUANT_MAX).astype(np.int16)
+    scale = extent / QUANT_MAX
+    matrix = [scale[0], 0.0, 0.0, 0.0,
+              0.0, scale[1], 0.0, 0.0,
+              0.0, 0.0, scale[2], 0.0,
+              bbox_min[0], bbox_min[1], bbox_min[2], 1.0]
+    return q, [float(m) for m in matrix]
+
+class _BufferBuilder():
+    """
+    Accumulate binary blobs into a single 4-byte aligned glTF buffer.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.length = 0
+        self.buffer_views = []
+
+    def add(self, data: bytes, target: Union[int, None]=None, stride: Union[int, None]=None) -> int:
+        """
+        Append a blob and return its bufferView index.
+        """
+        view = {'buffer': 0, 'byteOffset': self.length, 'byteLength': len(data)}
+        if stride is not None:
+            view['byteStride'] = stride
+        if target is not None:
+            view['target'] = target
+        self.chunks.append(data)
+        self.length += len(data)
+        pad = -self.length % 4
+        if pad:
+            self.chunks.append(b'\x00' * pad)
+            self.length += pad
+        self.buffer_views.append(view)
+        return len(self.buffer_views) - 1
+
+    def tobytes(self) -> bytes:
+        return b''.join(self.chunks)
+
+def build_curtain_gltf(lats, lons, heights, depth: float, texture: Union[np.ndarray, None]=None) -> dict:
+    """
+    Create a quantized glTF curtain mesh for a GPR track, optionally painted
+    with a radargram image.
+
+    Vertices are placed in ECEF relative to the center of the mesh bounding
+    box (returned as ``'rtc_center'`` for the b3dm ``RTC_CENTER``) and stored
+    in glTF's Y-up axes. Positions are stored as ``int16`` and texture
+    coordinates as normalized ``uint16`` (``KHR_mesh_quantization``); the
+    dequantization transform is baked into the node matrix.
+
+    :param lats: The latitudes of the traces
+    :type lats: list or numpy.ndarray
+    :param lons: The longitudes of the traces
+    :type lons: list or numpy.ndarray
+    :param heights: The surface ellipsoid heights of the traces
+    :type heights: list or numpy.ndarray
+    :param float depth: The depth of the profile below the surface
+    :param texture: RGBA radargram image (see :py:func:`radargram_image`) to paint the mesh with
+    :type texture: numpy.ndarray or None
+    :return: The glTF JSON document (``'json'``), its binary buffer (``'bin'``), the ECEF center of the mesh (``'rtc_center'``) and the radius of its bounding sphere (``'radius'``)
+    :rtype: dict
+    """
+    n = len(lats)
+    if n < 2:
+        raise ValueError('At least 2 traces are needed to build a profile mesh (got %s)' % (n))
+    ecef = curtain_positions(lats, lons, heights, depth)
+    center = (ecef.min(axis=0) + ecef.max(axis=0)) / 2
+    rel = ecef - center
+    q, matrix = quantize_positions(ecef_to_gltf(rel))
+    uv = curtain_uvs(n)
+    idx = curtain_indices(n)
+
+    # vertex attributes must be 4-byte aligned, so pad each int16 VEC3 to 8 bytes
+    q_padded = np.zeros((len(q), 4), dtype=np.int16)
+    q_padded[:, :3] = q
+
+    bb = _BufferBuilder()
+    pos_view = bb.add(q_padded.tobytes(), ARRAY_BUFFER, stride=8)
+    uv_view = bb.add(uv.tobytes(), ARRAY_BUFFER)
+    idx_view = bb.add(idx.tobytes(), ELEMENT_ARRAY_BUFFER)
+
+    accessors = [
+        {'bufferView': pos_view, 'componentType': SHORT, 'count': len(q), 'type': 'VEC3',
+         'min': q.min(axis=0).tolist(), 'max': q.max(axis=0).tolist()},
+        {'bufferView': uv_view, 'componentType': UNSIGNED_SHORT, 'normalized': True,
+         'count': len(uv), 'type': 'VEC2'},
+        {'bufferView': idx_view, 'componentType': UNSIGNED_SHORT if idx.dtype == np.uint16 else UNSIGNED_INT,
+         'count': len(idx), 'type': 'SCALAR'},
+    ]
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'pdgsubsurface'},
+        'extensionsUsed': ['KHR_mesh_quantization'],
+        'extensionsRequired': ['KHR_mesh_quantization'],
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'mesh': 0, 'matrix': matrix}],
+        'meshes': [{'primitives': [{'attributes': {'POSITION': 0, 'TEXCOORD_0': 1}, 'indices': 2}]}],
+        'accessors': accessors,
+        'bufferViews': bb.buffer_views,
+        'buffers': [{'byteLength': bb.length}],
+    }
+    if texture is not None:
+        img_view = bb.add(encode_png(texture))
+        gltf['extensionsUsed'].append('KHR_materials_unlit')
+        gltf['images'] = [{'bufferView': img_view, 'mimeType': 'image/png'}]
+        gltf['samplers'] = [{'magFilter': 9729, 'minFilter': 9729}]
+        gltf['textures'] = [{'sampler': 0, 'source': 0}]
+        gltf['materials'] = [{'pbrMetallicRoughness': {'baseColorTexture': {'index': 0},
+                                                        'metallicFactor': 0.0},
+                              'doubleSided': True,
+                              'extensions': {'KHR_materials_unlit': {}}}]
+        gltf['meshes'][0]['primitives'][0]['material'] = 0
+        gltf['buffers'][0]['byteLength'] = bb.length
+    return {'json': gltf, 'bin': bb.tobytes(),
+            'rtc_center': center.tolist(),
+            'radius': float(np.linalg.norm(rel, axis=1).max())}
+
+def to_glb(gltf_model: dict) -> bytes:
+    """
+    Pack a glTF model from :py:func:`build_curtain_gltf` as binary glTF
+    (GLB). The total length is padded to a multiple of 8 bytes so the result
+    can be embedded directly in a b3dm tile.
+
+    :param dict gltf_model: The glTF JSON document (``'json'``) and binary buffer (``'bin'``)
+    :return: The GLB file contents
+    :rtype: bytes
+    """
+    js = json.dumps(gltf_model['json'], separators=(',', ':')).encode()
+    js += b' ' * (-len(js) % 4)
+    bin_blob = gltf_model['bin'] + b'\x00' * (-len(gltf_model['bin']) % 4)
+    total = 12 + 8 + len(js) + 8 + len(bin_blob)
+    if total % 8:
+        js += b' ' * 4
+        total += 4
+    return b''.join((struct.pack('<4sII', b'glTF', 2, total),
+                     struct.pack('<I4s', len(js), b'JSON'), js,
+                     struct.pack('<I4s', len(bin_blob), b'BIN\x00'), bin_blob))
+
+def to_b3dm(glb: bytes, rtc_center: Union[list, None]=None) -> bytes:
+    """
+    Wrap a GLB in a 3D Tiles batched 3D model (b3dm) tile with an empty
+    batch table.
+
+    :param bytes glb: The GLB file contents (8-byte aligned, see :py:func:`to_glb`)
+    :param rtc_center: ECEF position the glTF vertices are relative to (see :py:func:`build_curtain_gltf`)
+    :type rtc_center: list or None
+    :return: The b3dm file contents
+    :rtype: bytes
+    """
+    header_len = 28
+    feature_table = {'BATCH_LENGTH': 0}
+    if rtc_center is not None:
+        feature_table['RTC_CENTER'] = [float(c) for c in rtc_center]
+    ft = json.dumps(feature_table, separators=(',', ':')).encode()
+    ft += b' ' * (-(header_len + len(ft)) % 8)
+    total = header_len + len(ft) + len(glb)
+    return b''.join((struct.pack('<4sIIIIII', b'b3dm', 1, total, len(ft), 0, 0, 0), ft, glb))
+
+def build_tileset(tiles: list) -> dict:
+    """
+    Create a 3D Tiles ``tileset.json`` document with one child tile per
+    model, each bounded by a sphere around its ECEF center.
+
+    :param list tiles: Dicts with the content ``'uri'``, ECEF ``'center'`` and bounding ``'radius'`` of each tile
+    :return: The tileset document
+    :rtype: dict
+    """
+    centers = np.array([t['center'] for t in tiles], dtype=np.float64)
+    radii = np.array([t['radius'] for t in tiles], dtype=np.float64)
+    root_center = centers.mean(axis=0)
+    root_radius = float((np.linalg.norm(centers - root_center, axis=1) + radii).max())
+    children = [{'boundingVolume': {'sphere': [float(c) for c in t['center']] + [float(t['radius'])]},
+                 'geometricError': 0.0,
+                 'content': {'uri': t['uri']}} for t in tiles]
+    return {'asset': {'version': '1.0', 'generator': 'pdgsubsurface'},
+            'geometricError': root_radius,
+            'root': {'boundingVolume': {'sphere': root_center.tolist() + [root_radius]},
+                     'geometricError': root_radius,
+                     'refine': 'ADD',
+                     'children': children}}
@@ -1,24 +1,97 @@
+import os
+import json
+import shutil
 from pathlib import Path
-from typing import Union, Literal
+from typing import Union, Literal, List
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pyegt.defs import REGIONS
 from logging import getLogger
-from readgssi import readgssi
+import numpy as np
 
 from . import utils
 from . import geoid
+from . import gltf
+
+def _build_gltf(source, location_info, depth_info):
+    """
+    Create a glTF model for a single radar profile. This is a module-level
+    function so that it can be pickled and run in a worker process. The
+    profile is passed as a ``(path, channel)`` handle and memory-mapped
+    here, so each worker reads its own profile instead of receiving a
+    pickled copy.
+
+    :param source: The GPR file and channel of the radar profile.
+    :type source: tuple(pathlib.Path, int)
+    :param location_info: The per-trace ``'lat'``, ``'lon'`` and ellipsoid ``'height'`` of the profile.
+    :type location_info: dict
+    :param depth_info: The information about the depth (``'depth'``: profile depth in meters).
+    :type depth_info: dict
+    :return: The glTF model (see :py:func:`pdgsubsurface.gltf.build_curtain_gltf`).
+    :rtype: dict
+    """
+    path, channel = source
+    radar_profile = utils.memmap_dzt(path)[channel]
+    # Use location information and depth information to create a quantized curtain mesh
+    # painted with a GPR profile image that represents subsurface conditions
+    return gltf.build_curtain_gltf(location_info['lat'],
+                                   location_info['lon'],
+                                   location_info['height'],
+                                   depth_info['depth'],
+                                   texture=gltf.radargram_image(radar_profile))
+
+def _unique_names(files: List[Path]):
+    """
+    Name each file after its stem. Stems shared by several files (such as
+    GSSI's default ``FILE____001`` in different directories) are prefixed
+    with the parent directory name, and any that still clash are suffixed
+    with the file's position in the list.
+
+    :param files: The GPR files.
+    :type files: list of pathlib.Path
+    :return: One name per file, unique regardless of case.
+    :rtype: list of str
+    """
+    names = [f.stem for f in files]
+    for rename in (lambda i, f: '%s_%s' % (f.parent.name, f.stem),
+                   lambda i, f: '%s_%s' % (f.stem, i)):
+        counts = Counter(n.lower() for n in names)
+        names = [rename(i, f) if counts[n.lower()] > 1 else n
+                 for i, (f, n) in enumerate(zip(files, names))]
+    return names
 
 class Pipeline():
     """
     Process GPR data to create a 3dTiles model that represents a subsurface profile.
 
+    Several GPR files can be processed in one run so that the import cost
+    of pyproj and pyegt, as well as the cached height model lookups in
+    :py:mod:`pdgsubsurface.geoid`, are shared.
+
     :param gpr_files: The GPR files to process.
-    :type gpr_files: str, Path
+    :type gpr_files: list of str or Path
     :param output_dir: The output directory in which to save the model.
     :type output_dir: str, Path
+    :param bool archive: Whether to archive the input dataset
+    :param float translate_z: Translation for z values
+    :param from_geoid: The geoid, tidal, or geopotential model to translate from
+    :type from_geoid: str or None
+    :param str geoid_region: The NGS region
     """
-    def __init__(self, gpr_files: Union[str, Path], output_dir: Union[str, Path]):
-        self.gpr_files = gpr_files
+    __slots__ = ('gpr_files', 'names', 'output_dir', 'archive', 'translate_z',
+                 'from_geoid', 'geoid_region', 'models', 'logger')
+
+    def __init__(self, gpr_files: List[Union[str, Path]], output_dir: Union[str, Path],
+                 archive: bool=False, translate_z: float=0.0,
+                 from_geoid: Union[str, Literal[None]]=None, geoid_region: str=REGIONS[0]):
+        self.gpr_files = [Path(f) for f in gpr_files]
+        # Output files are named after their source, so names must be unique
+        self.names = _unique_names(self.gpr_files)
         self.output_dir = output_dir
+        self.archive = archive
+        self.translate_z = translate_z
+        self.from_geoid = from_geoid
+        self.geoid_region = geoid_region
         self.models = []
         self.logger = getLogger(__name__)
 
@@ -26,58 +99,105 @@ class Pipeline():
         """
         Process the GPR data to create a 3dTiles model.
         """
-        # Create radar profiles
-        radar_profiles = self.create_radar_profiles()
-        # Extract location and depth information
-        location_info = self.extract_location_info()
-        depth_info = self.extract_depth_info()
-        # Create models
-        for radar_profile in radar_profiles:
-            gltf_model = self.create_glTF_model(radar_profile, location_info, depth_info)
-            self.models.append(self.create_3dtiles_model(gltf_model))
+        if self.archive:
+            self.archive_files()
+        names, sources, location_infos, depth_infos = [], [], [], []
+        for f, name in zip(self.gpr_files, self.names):
+            # Create radar profiles (one per channel)
+            profiles = self.create_radar_profiles(f)
+            # Extract location and depth information; all channels share the track
+            location_info = self.extract_location_info(f, profiles[0].shape[1])
+            depth_info = self.extract_depth_info(f)
+            names.extend('%s_ch%s' % (name, c) for c in range(len(profiles)))
+            # Workers map their own profile from a (path, channel) handle
+            sources.extend((f, c) for c in range(len(profiles)))
+            location_infos.extend([location_info] * len(profiles))
+            depth_infos.extend(depth_info)
+        # Create models; each profile is independent, so build them in parallel
+        if len(sources) < 2:
+            gltf_models = [self.create_glTF_model(*args)
+                           for args in zip(sources, location_infos, depth_infos)]
+        else:
+            with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(sources))) as ex:
+                gltf_models = list(ex.map(_build_gltf, sources, location_infos, depth_infos))
+        for name, gltf_model in zip(names, gltf_models):
+            self.models.append({'name': name,
+                                'b3dm': self.create_3dtiles_model(gltf_model),
+                                'center': gltf_model['rtc_center'],
+                                'radius': gltf_model['radius']})
         # Save models
         self.save_models()
 
-    def create_radar_profiles(self):
+    def archive_files(self):
+        """
+        Copy the input GPR files (and their DZG GPS files) to an ``archive``
+        folder in the output directory, under the same names as their tiles.
+        """
+        archive_dir = Path(self.output_dir).joinpath('archive')
+        utils.make_dirs(archive_dir)
+        for f, name in zip(self.gpr_files, self.names):
+            for src in (f, f.with_suffix('.DZG'), f.with_suffix('.dzg')):
+                if src.is_file():
+                    shutil.copy2(src, archive_dir.joinpath(name + src.suffix))
+                    self.logger.info('Archived %s', src)
+
+    def create_radar_profiles(self, f: Path):
         """
-        Create radar profiles for input GPR files using readgssi.
+        Create radar profiles for a GPR file, one per channel.
+        The radar data is memory-mapped rather than read into memory.
 
+        :param f: The GPR file.
+        :type f: pathlib.Path
         :return: The radar profiles.
         :rtype: list of numpy.ndarray
         """
-        # Use the readgssi module to create radar profiles for input GPR files
-        radar_profiles = readgssi.readgssi(self.gpr_files)
-        return radar_profiles
+        return utils.memmap_dzt(f)
 
-    def extract_location_info(self):
+    def extract_location_info(self, f: Path, n_traces: int):
         """
-        Extract location information from GPR data.
+        Extract per-trace location information for a GPR file.
 
-        :return: The location information.
+        Heights come from the GPS altitude plus the receiver's geoid
+        separation, unless ``from_geoid`` is set, in which case the altitude
+        is taken to be relative to that model and converted to ellipsoid
+        height with :py:func:`pdgsubsurface.geoid.get_adjustments_grid`.
+        ``translate_z`` is then added. DZG fixes are already WGS84
+        latitude/longitude, so the track needs no horizontal reprojection.
+
+        :param f: The GPR file.
+        :type f: pathlib.Path
+        :param int n_traces: The number of traces in the file.
+        :return: The location information (``'lat'``, ``'lon'``, ``'alt'``, ``'height'``).
         :rtype: dict
         """
-        # Extract location information from GPR data
-        location_info = utils.extract_location_info(self.gpr_files)
+        location_info = utils.extract_location_info(f, n_traces)
+        if self.from_geoid:
+            model = geoid.use_model(user_vrs=self.from_geoid)
+            adjustments = geoid.get_adjustments_grid(location_info['lat'],
+                                                     location_info['lon'],
+                                                     model, self.geoid_region)
+            location_info['height'] = location_info['alt'] + np.array([float(a) for a in adjustments])
+        location_info['height'] = location_info['height'] + self.translate_z
         return location_info
 
-    def extract_depth_info(self):
+    def extract_depth_info(self, f: Path):
         """
-        Extract depth information from GPR data.
+        Extract depth information for each channel of a GPR file.
 
-        :return: The depth information.
-        :rtype: dict
+        :param f: The GPR file.
+        :type f: pathlib.Path
+        :return: The depth information, one dict per channel.
+        :rtype: list of dict
         """
-        # Extract depth information from GPR data
-        depth_info = utils.extract_depth_info(self.gpr_files)
-        return depth_info
+        return utils.extract_depth_info(f)
 
-    def create_glTF_model(self, radar_profiles, location_info, depth_info):
+    def create_glTF_model(self, source, location_info, depth_info):
         """
-        Create a glTF model using radar profiles, location array, and depth
+        Create a glTF model using a radar profile, location array, and depth
         information.
 
-        :param radar_profiles: The radar profiles representing subsurface conditions.
-        :type radar_profiles: list
+        :param source: The GPR file and channel of the radar profile.
+        :type source: tuple(pathlib.Path, int)
         :param location_info: The information about the location.
         :type location_info: dict
         :param depth_info: The information about the depth.
@@ -85,31 +205,35 @@ class Pipeline():
         :return: The glTF model.
         :rtype: dict
         """
-        # Use location information, depth information, and subsurface image data to create a glTF model
-        # Paint the model with a GPR profile image that represents subsurface conditions
-        # Implement the logic here
-        pass
+        return _build_gltf(source, location_info, depth_info)
 
     def create_3dtiles_model(self, gltf_model):
         """
-        Create a 3dTiles model using radar profiles, location array, and depth
-        information.
+        Create a 3dTiles model (a binary b3dm tile wrapping a GLB) from a glTF
+        model.
 
-        :param gltf_model: The radar profiles representing subsurface conditions.
-        :type gltf_model: list
+        :param gltf_model: The glTF model created by :py:func:`_build_gltf`.
+        :type gltf_model: dict
         :return: The 3dTiles model.
-        :rtype: dict
+        :rtype: bytes
         """
-        # Use location information, depth information, and subsurface image data to create a 3dTiles model
-        # Paint the model with a GPR profile image that represents subsurface conditions
-        # Implement the logic here
-        pass
+        return gltf.to_b3dm(gltf.to_glb(gltf_model), rtc_center=gltf_model['rtc_center'])
 
     def save_models(self):
         """
-        Save the models to the output directory.
+        Save the models to the output directory as ``<name>_ch<channel>.b3dm``
+        tiles (see :py:func:`_unique_names`) along with the ``tileset.json`` that references them.
         """
-        # Save the models to the output directory
+        output_dir = Path(self.output_dir)
+        utils.make_dirs(output_dir)
+        tiles = []
         for model in self.models:
-            # Save the model to the output directory
-            pass
+            f = output_dir.joinpath('%s.b3dm' % (model['name']))
+            with open(f, 'wb') as fw:
+                fw.write(model['b3dm'])
+            self.logger.info('Wrote %s', f)
+            tiles.append({'uri': f.name, 'center': model['center'], 'radius': model['radius']})
+        f = output_dir.joinpath('tileset.json')
+        with open(f, 'w') as fw:
+            json.dump(gltf.build_tileset(tiles), fw, indent=2)
+        self.logger.info('Wrote %s', f)
@@ -1,8 +1,17 @@
+import struct
 from pathlib import Path
 from datetime import datetime
+import numpy as np
 from typing import Union
+from functools import lru_cache
 from pyproj import CRS
-from logging import getLogger
+from logging import getLogger, INFO
+
+_cached_from_wkt = lru_cache(maxsize=256)(CRS.from_wkt)
+
+DZT_MINHEADSIZE = 1024
+DZT_DTYPES = {8: np.uint8, 16: np.uint16, 32: np.int32}
+C = 299792458 # speed of light in a vacuum (m/s)
 
 def timer(time: Union[datetime, bool]=False) -> Union[datetime, int, float]:
     """
@@ -19,38 +28,43 @@ def timer(time: Union[datetime, bool]=False) -> Union[datetime, int, float]:
         time = (datetime.now() - time).seconds
         return time, time/60
 
-def make_dirs(d: Path, exist_ok: bool=True):
+def make_dirs(d: Path, exist_ok: bool=True, parents: bool=True):
     """
     Simple wrapper to create directory using os.makedirs().
     Included is a logging command.
 
     :param pathlib.Path d: The directory to create
     :param bool exist_ok: Whether to gracefully accept an existing directory (default: True)
+    :param bool parents: Whether to create missing parent directories (default: True)
     """
-    d.mkdir(exist_ok=exist_ok)
+    d.mkdir(parents=parents, exist_ok=exist_ok)
 
 def rm_files(files: list[Path]=[]):
     """
     Remove a list of intermediate processing files.
+    Missing files and directories are skipped.
 
     :param list files: A list `pathlib.Path`s to remove
     """
     for f in files:
-        if f.is_file():
-            f.unlink()
+        try:
+            f.unlink(missing_ok=True)
+        except OSError:
+            # directories raise IsADirectoryError on Linux but
+            # PermissionError on macOS; anything else is a real error
+            if not f.is_dir():
+                raise
 
 def write_wkt_to_file(f: Path, wkt: str):
     """
     Write well-known text (WKT) string to file. Will overwrite existing file.
 
-    :param f: File path to write to (wil)
+    :param f: File path to write to (will be truncated if it exists)
     :type f: pathlib.Path
     :param str wkt: String to write
     """
-    if f.is_file():
-        f.unlink()
     with open(f, 'w') as fw:
-        fw.write(str(wkt))
+        fw.write(wkt if isinstance(wkt, str) else str(wkt))
 
 def read_wkt_from_file(f: Path) -> str:
     """
@@ -61,8 +75,7 @@ def read_wkt_from_file(f: Path) -> str:
     :return: The well-known text of the CRS in use
     :rtype: str
     """
-    with open(f, 'r') as fr:
-        return fr.read()
+    return Path(f).read_text()
 
 def get_epsgs_from_wkt(wkt: str) -> tuple:
     """
@@ -77,29 +90,188 @@ def get_epsgs_from_wkt(wkt: str) -> tuple:
     L = getLogger(__name__)
     epsg_h, epsg_v = None, None
     h_name, v_name = None, None
-    crs = CRS.from_wkt(wkt)
+    crs = _cached_from_wkt(wkt)
     if crs.is_compound:
-        L.info('Found compound coordinate system (COMPD_CS): %s entries' % (len(crs.sub_crs_list)))
+        if L.isEnabledFor(INFO):
+            L.info('Found compound coordinate system (COMPD_CS): %s entries', len(crs.sub_crs_list))
         if len(crs.sub_crs_list) > 2: # not sure if this case exists, but should be warned anyway
             L.warning('More than 2 entries in a compound coordinate system may cause an unwanted override!')
-        for c in crs.sub_crs_list:
-            if c.is_vertical:
-                epsg_v = c.to_epsg()
-                v_name = c.name
-            else:
-                epsg_h = c.to_epsg()
-                h_name = c.name
+        sub_crs_list = crs.sub_crs_list
     else:
-        if crs.is_vertical:
-            epsg_v = crs.to_epsg()
-            v_name = crs.name
+        sub_crs_list = [crs]
+    for c in sub_crs_list:
+        entry = (c.to_epsg(), c.name)
+        if c.is_vertical:
+            epsg_v, v_name = entry
         else:
-            epsg_h = crs.to_epsg()
-            h_name = crs.name
-    if epsg_h:
-        L.info('Found horizontal EPSG: %s (%s)' % (epsg_h, h_name))
-    if epsg_v:
-        L.info('Found vertical EPSG: %s (%s)' % (epsg_v, v_name))
+            epsg_h, h_name = entry
+    if L.isEnabledFor(INFO):
+        if epsg_h:
+            L.info('Found horizontal EPSG: %s (%s)', epsg_h, h_name)
+        if epsg_v:
+            L.info('Found vertical EPSG: %s (%s)', epsg_v, v_name)
     return crs, epsg_h, epsg_v, h_name, v_name
 
+def _read_channel_header(fr, pos: int) -> tuple:
+    """
+    Read the range (ns) and relative permittivity from the channel header at
+    byte ``pos`` of an open DZT file.
+    """
+    fr.seek(pos + 26)
+    rhf_range, = struct.unpack('<f', fr.read(4))
+    fr.seek(pos + 54)
+    rhf_epsr, = struct.unpack('<f', fr.read(4))
+    return rhf_range, rhf_epsr
+
+def read_dzt_header(f: Path) -> dict:
+    """
+    Read the fields of a GSSI DZT header needed to locate and scale the radar
+    data.
+
+    :param f: The DZT file to read
+    :type f: pathlib.Path
+    :return: The data offset (bytes), number of channels, samples per trace, sample dtype, and per-channel range (ns) and relative permittivity
+    :rtype: dict
+    :raises ValueError: if the header is truncated or the sample size is not supported
+    """
+    with open(f, 'rb') as fr:
+        head = fr.read(58)
+        if len(head) < 58:
+            raise ValueError('Truncated DZT header in %s' % (f))
+        rh_data, rh_nsamp, rh_bits = struct.unpack('<HHH', head[2:8])
+        rh_nchan, = struct.unpack('<H', head[52:54])
+        if rh_bits not in DZT_DTYPES:
+            raise ValueError('Unsupported DZT sample size in %s: %s bits' % (f, rh_bits))
+        # same rule readgssi uses to locate the start of the data
+        offset = DZT_MINHEADSIZE * (rh_data if rh_data < DZT_MINHEADSIZE else rh_nchan)
+        # each channel has its own header block when there is room for it
+        channels = [_read_channel_header(fr, c * DZT_MINHEADSIZE if (c + 1) * DZT_MINHEADSIZE <= offset else 0)
+                    for c in range(rh_nchan)]
+    return {'offset': offset, 'nchan': rh_nchan, 'nsamp': rh_nsamp,
+            'dtype': DZT_DTYPES[rh_bits],
+            'range': [c[0] for c in channels], 'epsr': [c[1] for c in channels]}
+
+def memmap_dzt(f: Path) -> list:
+    """
+    Memory-map the radar data of a GSSI DZT file instead of reading it into
+    memory. Pages are only read from disk when they are accessed, so
+    downstream processing can slice files larger than RAM.
+
+    :param f: The DZT file to map
+    :type f: pathlib.Path
+    :return: One read-only array of shape (samples, traces) per channel
+    :rtype: list of numpy.ndarray
+    :raises ValueError: if the file holds no complete trace
+    """
+    h = read_dzt_header(f)
+    trace_len = h['nchan'] * h['nsamp']
+    n_traces = (Path(f).stat().st_size - h['offset']) // (trace_len * np.dtype(h['dtype']).itemsize)
+    if n_traces < 1:
+        raise ValueError('No radar traces found in %s' % (f))
+    samples = np.memmap(f, dtype=h['dtype'], mode='r', offset=h['offset'],
+                        shape=(n_traces, h['nchan'], h['nsamp']))
+    return [samples[:, c, :].T for c in range(h['nchan'])]
+
+def extract_depth_info(f: Path) -> list:
+    """
+    Get the depth covered by each channel of a DZT file from its two-way
+    travel time range and relative permittivity.
+
+    :param f: The DZT file to read
+    :type f: pathlib.Path
+    :return: One dict per channel with the profile depth in meters (``'depth'``)
+    :rtype: list of dict
+    """
+    h = read_dzt_header(f)
+    depth_info = []
+    for rng, epsr in zip(h['range'], h['epsr']):
+        if epsr <= 0:
+            raise ValueError('Invalid relative permittivity in %s: %s' % (f, epsr))
+        depth_info.append({'depth': rng * 1e-9 * C / np.sqrt(epsr) / 2})
+    return depth_info
 
+def _nmea_degrees(value: str, hemisphere: str) -> float:
+    """
+    Convert an NMEA ``(d)ddmm.mmmm`` coordinate to decimal degrees.
+    """
+    deg = int(float(value) / 100)
+    dec = deg + (float(value) - deg * 100) / 60
+    return -dec if hemisphere in ('S', 'W') else dec
+
+def read_dzg(f: Path) -> dict:
+    """
+    Read the GPS fixes recorded alongside a DZT file. GSSI ``.DZG`` files
+    contain NMEA sentences in which each ``$GSSIS`` line (carrying the trace
+    number) is followed by the GGA fix taken at that trace.
+
+    :param f: The DZG file to read
+    :type f: pathlib.Path
+    :return: Arrays of trace numbers (``'trace'``), ``'lat'``, ``'lon'``, orthometric altitude (``'alt'``) and geoid separation (``'sep'``)
+    :rtype: dict
+    :raises ValueError: if the file contains no valid fixes
+    """
+    fixes = []
+    trace = None
+    with open(f, 'r', errors='replace') as fr:
+        for line in fr:
+            fields = line.strip().split('*')[0].split(',')
+            if fields[0] == '$GSSIS' and len(fields) > 1:
+                trace = int(fields[1])
+            elif fields[0].endswith('GGA') and (trace is not None) and len(fields) > 11:
+                if fields[6] in ('', '0') or not fields[2]:
+                    # no fix
+                    continue
+                fixes.append((trace,
+                              _nmea_degrees(fields[2], fields[3]),
+                              _nmea_degrees(fields[4], fields[5]),
+                              float(fields[9]),
+                              float(fields[11] or 0)))
+                trace = None
+    if not fixes:
+        raise ValueError('No GPS fixes found in %s' % (f))
+    arr = np.array(fixes, dtype=np.float64)
+    return {'trace': arr[:, 0], 'lat': arr[:, 1], 'lon': arr[:, 2],
+            'alt': arr[:, 3], 'sep': arr[:, 4]}
+
+def extract_location_info(f: Path, n_traces: int) -> dict:
+    """
+    Get the position of every trace of a DZT file by interpolating the GPS
+    fixes in the accompanying ``.DZG`` file (see :py:func:`read_dzg`).
+
+    :param f: The DZT file
+    :type f: pathlib.Path
+    :param int n_traces: The number of traces in the DZT file
+    :return: Per-trace ``'lat'``, ``'lon'``, orthometric ``'alt'`` and ellipsoid ``'height'`` (``alt`` plus the receiver's geoid separation)
+    :rtype: dict
+    :raises FileNotFoundError: if there is no DZG file next to the DZT file
+    """
+    f = Path(f)
+    for dzg in (f.with_suffix('.DZG'), f.with_suffix('.dzg')):
+        if dzg.is_file():
+            break
+    else:
+        raise FileNotFoundError('No DZG file found for %s' % (f))
+    fixes = read_dzg(dzg)
+    traces = np.arange(n_traces)
+    location_info = {k: np.interp(traces, fixes['trace'], fixes[k])
+                     for k in ('lat', 'lon', 'alt', 'sep')}
+    location_info['height'] = location_info['alt'] + location_info.pop('sep')
+    return location_info
+
+def validate_dzt(f: Path):
+    """
+    Check that a DZT file can be turned into a tile before any processing
+    starts: the header must be readable, the file must hold at least two
+    traces (a curtain needs two ends) and a ``.DZG`` file with GPS fixes
+    must sit next to it.
+
+    :param f: The DZT file to check
+    :type f: pathlib.Path
+    :raises ValueError: if the header or the DZG file is invalid, or there are fewer than two traces
+    :raises FileNotFoundError: if there is no DZG file next to the DZT file
+    """
+    n_traces = memmap_dzt(f)[0].shape[1]
+    if n_traces < 2:
+        raise ValueError('At least 2 radar traces are needed in %s, found %s' % (f, n_traces))
+    extract_depth_info(f)
+    extract_location_info(f, n_traces)
@@ -0,0 +1,64 @@
+import struct
+
+import numpy as np
+import pytest
+
+def write_dzt(f, nchan: int=1, nsamp: int=64, n_traces: int=20, bits: int=16,
+              range_ns: float=100.0, epsr: float=4.0):
+    """
+    Write a synthetic GSSI DZT file with one 1024-byte header block per
+    channel, followed by trace-interleaved samples. Sample ``i`` of trace
+    ``t`` in channel ``c`` holds ``t * 100 + c * 10 + i % 10``.
+    """
+    header = bytearray(1024 * nchan)
+    for c in range(nchan):
+        pos = 1024 * c
+        struct.pack_into('<HHHH', header, pos, 0x00ff, 1024, nsamp, bits)
+        struct.pack_into('<f', header, pos + 26, range_ns * (c + 1))
+        struct.pack_into('<H', header, pos + 52, nchan)
+        struct.pack_into('<f', header, pos + 54, epsr)
+    t = np.arange(n_traces)[:, None, None]
+    c = np.arange(nchan)[None, :, None]
+    i = np.arange(nsamp)[None, None, :]
+    dtype = {8: np.uint8, 16: np.uint16, 32: np.int32}[bits]
+    data = (t * 100 + c * 10 + i % 10).astype(dtype)
+    with open(f, 'wb') as fw:
+        fw.write(bytes(header))
+        fw.write(data.tobytes())
+    return data
+
+def write_dzg(f, traces=(0, 10, 19)):
+    """
+    Write a synthetic DZG file with one GGA fix per listed trace, moving
+    north by 0.001 minutes of latitude per trace.
+    """
+    lines = []
+    for t in traces:
+        lines.append('$GSSIS,%s,1234.5' % (t))
+        lines.append('$GPGGA,120000.00,6451.%04d,N,14751.0000,W,1,08,0.9,%.1f,M,7.5,M,,*47'
+                     % (t, 150.0 + t / 10))
+    with open(f, 'w') as fw:
+        fw.write('\n'.join(lines) + '\n')
+
+@pytest.fixture
+def dzt_writer():
+    """
+    The synthetic DZT writer (see :py:func:`write_dzt`), for tests that
+    need to control the file path or corrupt the file afterwards.
+    """
+    return write_dzt
+
+@pytest.fixture
+def dzt_factory(tmp_path):
+    """
+    Create synthetic DZT files (with matching DZG files) in a temporary
+    directory.
+    """
+    def make(name: str='LINE01', with_dzg: bool=True, **kwargs):
+        f = tmp_path.joinpath('%s.DZT' % (name))
+        f.parent.mkdir(parents=True, exist_ok=True)
+        write_dzt(f, **kwargs)
+        if with_dzg:
+            write_dzg(f.with_suffix('.DZG'), traces=(0, kwargs.get('n_traces', 20) // 2, kwargs.get('n_traces', 20) - 1))
+        return f
+    return make
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from pdgsubsurface import geoid, utils
+from pdgsubsurface.pipeline import Pipeline
+
+class FakeHeightModel():
+    """
+    Stand-in for :py:class:`pyegt.height.HeightModel` that records its
+    lookups instead of querying NGS, with a height that varies by location.
+    """
+    calls = []
+
+    def __init__(self, lat, lon, from_model, region):
+        self.calls.append((lat, lon, from_model, region))
+        self.height = -10.0 - lat / 10
+
+    def __float__(self):
+        return self.height
+
+@pytest.fixture
+def height_model(monkeypatch):
+    FakeHeightModel.calls = []
+    monkeypatch.setattr(geoid, 'HeightModel', FakeHeightModel)
+    geoid._height_model.cache_clear()
+    yield FakeHeightModel
+    geoid._height_model.cache_clear()
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_get_adjustments_grid_shares_lookups(height_model, workers):
+    # two clusters of points about 10 m apart, far from each other
+    lats = np.array([[64.86000, 64.86001, 64.86002],
+                     [65.00000, 65.00001, 64.86003]])
+    lons = np.full(lats.shape, -147.85)
+    heights = geoid.get_adjustments_grid(lats, lons, 'GEOID18', 'alaska', workers=workers)
+    assert heights.shape == lats.shape
+    assert len(height_model.calls) == 2
+    values = np.array([[float(h) for h in row] for row in heights])
+    np.testing.assert_allclose(values, -10.0 - np.round(lats, 3) / 10)
+
+def test_get_adjustments_grid_shape_mismatch(height_model):
+    with pytest.raises(ValueError):
+        geoid.get_adjustments_grid([64.86, 64.87], [-147.85], 'GEOID18', 'alaska')
+
+def test_pipeline_from_geoid_heights(height_model, dzt_factory, tmp_path):
+    f = dzt_factory('LINE01', n_traces=20)
+    p = Pipeline(gpr_files=[f], output_dir=tmp_path.joinpath('out'),
+                 translate_z=2.0, from_geoid='GEOID18', geoid_region='alaska')
+    location_info = p.extract_location_info(f, 20)
+    n = np.array([float(h) for h in geoid.get_adjustments_grid(location_info['lat'], location_info['lon'],
+                                                               'GEOID18', 'alaska')])
+    alt = utils.extract_location_info(f, 20)['alt']
+    np.testing.assert_allclose(location_info['height'], alt + n + 2.0)
+    assert {c[2:] for c in height_model.calls} == {('GEOID18', 'alaska')}
+
+def test_get_transformer_is_cached():
+    assert geoid._get_transformer(32606) is geoid._get_transformer(32606)
+    assert geoid._get_transformer(32606) is not geoid._get_transformer(3338)
+
+def test_crs_to_wgs84_batch():
+    xs, ys = [466000.0, 467000.0], [7193000.0, 7194000.0]
+    lats, lons = geoid.crs_to_wgs84_batch(xs, ys, 32606)
+    for x, y, lat, lon in zip(xs, ys, lats, lons):
+        assert geoid.crs_to_wgs84(x, y, 32606) == pytest.approx((lat, lon))
+    with pytest.raises(ValueError):
+        geoid.crs_to_wgs84_batch(xs, ys[:1], 32606)
+
+@pytest.mark.parametrize('las_vrs, user_vrs', [
+    (None, 'NOPE'),       # 6. empty las_vrs / unmatched user_vrs
+    ('NOPE', None),       # 7. unmatched las_vrs / empty user_vrs
+    ('NOPE', 'GEOID18'),  # 8. unmatched las_vrs / matched user_vrs
+    ('NOPE', 'NOPE'),     # 9. unmatched las_vrs / unmatched user_vrs
+])
+def test_use_model_unmatched_exits(las_vrs, user_vrs):
+    with pytest.raises(SystemExit):
+        geoid.use_model(user_vrs=user_vrs, las_vrs=las_vrs)
+
+def test_use_model_matches():
+    # scenarios 4, 5 and 2
+    assert geoid.use_model() is None
+    assert geoid.use_model(user_vrs='GEOID18') == 'GEOID18'
+    assert geoid.use_model(user_vrs='NOPE', las_vrs='GEOID18') == 'GEOID18'
@@ -0,0 +1,115 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from pdgsubsurface import gltf
+
+LATS = np.linspace(64.8600, 64.8610, 50)
+LONS = np.linspace(-147.8500, -147.8480, 50)
+HEIGHTS = np.linspace(150.0, 152.0, 50)
+DEPTH = 10.0
+
+def parse_glb(glb: bytes):
+    """
+    Split a GLB into its JSON document and binary chunk.
+    """
+    magic, version, length = struct.unpack('<4sII', glb[:12])
+    assert (magic, version, length) == (b'glTF', 2, len(glb))
+    json_len, json_type = struct.unpack('<I4s', glb[12:20])
+    assert json_type == b'JSON'
+    doc = json.loads(glb[20:20 + json_len])
+    bin_len, bin_type = struct.unpack('<I4s', glb[20 + json_len:28 + json_len])
+    assert bin_type == b'BIN\x00'
+    return doc, glb[28 + json_len:28 + json_len + bin_len]
+
+def decode_positions(doc: dict, blob: bytes, rtc_center) -> np.ndarray:
+    """
+    Dequantize the POSITION accessor of a curtain mesh back to ECEF, the way
+    a 3D Tiles client would: node matrix, Y-up to Z-up, then RTC_CENTER.
+    """
+    acc = doc['accessors'][doc['meshes'][0]['primitives'][0]['attributes']['POSITION']]
+    view = doc['bufferViews'][acc['bufferView']]
+    raw = np.frombuffer(blob, dtype=np.int16, count=acc['count'] * view['byteStride'] // 2,
+                        offset=view['byteOffset'])
+    q = raw.reshape(acc['count'], -1)[:, :3].astype(np.float64)
+    m = np.array(doc['nodes'][0]['matrix']).reshape(4, 4).T
+    yup = (m @ np.c_[q, np.ones(len(q))].T).T[:, :3]
+    zup = np.stack((yup[:, 0], -yup[:, 2], yup[:, 1]), axis=-1)
+    return zup + np.asarray(rtc_center)
+
+def test_geodetic_to_ecef():
+    ecef = gltf.geodetic_to_ecef([0.0, 0.0, 90.0], [0.0, 90.0, 0.0], [0.0, 100.0, 0.0])
+    b = gltf.WGS84_A * np.sqrt(1 - gltf.WGS84_E2)
+    np.testing.assert_allclose(ecef, [[gltf.WGS84_A, 0, 0],
+                                      [0, gltf.WGS84_A + 100, 0],
+                                      [0, 0, b]], atol=1e-6)
+
+def test_curtain_indices_dtype():
+    assert gltf.curtain_indices(3).tolist() == [0, 1, 2, 2, 1, 3, 2, 3, 4, 4, 3, 5]
+    assert gltf.curtain_indices(32767).dtype == np.uint16
+    assert gltf.curtain_indices(32768).dtype == np.uint32
+
+def test_curtain_dequantizes_to_ecef():
+    model = gltf.build_curtain_gltf(LATS, LONS, HEIGHTS, DEPTH)
+    doc, blob = parse_glb(gltf.to_glb(model))
+    assert doc['extensionsRequired'] == ['KHR_mesh_quantization']
+    decoded = decode_positions(doc, blob, model['rtc_center'])
+    expected = gltf.curtain_positions(LATS, LONS, HEIGHTS, DEPTH)
+    # int16 quantization over a ~150 m bounding box is good to a few mm
+    np.testing.assert_allclose(decoded, expected, atol=0.01)
+    # the bottom of the curtain is DEPTH closer to the earth's center
+    top, bottom = np.linalg.norm(decoded[0::2], axis=1), np.linalg.norm(decoded[1::2], axis=1)
+    np.testing.assert_allclose(top - bottom, DEPTH, atol=0.05)
+    assert model['radius'] >= np.linalg.norm(expected - model['rtc_center'], axis=1).max() - 1e-6
+
+def test_curtain_needs_two_traces():
+    with pytest.raises(ValueError):
+        gltf.build_curtain_gltf([64.0], [-147.0], [100.0], DEPTH)
+
+def test_b3dm_layout():
+    model = gltf.build_curtain_gltf(LATS, LONS, HEIGHTS, DEPTH)
+    glb = gltf.to_glb(model)
+    assert len(glb) % 8 == 0
+    b3dm = gltf.to_b3dm(glb, rtc_center=model['rtc_center'])
+    magic, version, length, ft_json_len, ft_bin_len, bt_json_len, bt_bin_len = struct.unpack('<4sIIIIII', b3dm[:28])
+    assert (magic, version, length) == (b'b3dm', 1, len(b3dm))
+    assert (ft_bin_len, bt_json_len, bt_bin_len) == (0, 0, 0)
+    assert (28 + ft_json_len) % 8 == 0
+    feature_table = json.loads(b3dm[28:28 + ft_json_len])
+    assert feature_table == {'BATCH_LENGTH': 0, 'RTC_CENTER': model['rtc_center']}
+    assert b3dm[28 + ft_json_len:] == glb
+
+def synthetic_uint16_profile(n_samples: int=256, n_traces: int=300) -> np.ndarray:
+    """
+    Offset-binary uint16 profile of a decaying sinusoid, as stored in DZT files.
+    """
+    t = np.arange(n_samples)[:, None]
+    signal = 20000 * np.exp(-t / 80) * np.sin(t / 3 + np.arange(n_traces) / 50)
+    return (signal + 2 ** 15).astype(np.uint16)
+
+def test_agc_centers_offset_binary():
+    gained = gltf.agc(synthetic_uint16_profile(), window=32)
+    assert gained.dtype == np.float32
+    assert abs(float(gained.mean())) < 0.1
+    assert gained.min() < -1 and gained.max() > 1
+
+def test_agc_leaves_input_unchanged():
+    profile = gltf.center_samples(synthetic_uint16_profile())
+    before = profile.copy()
+    gltf.agc(profile, window=32)
+    np.testing.assert_array_equal(profile, before)
+
+def test_radargram_image_contrast():
+    img = gltf.radargram_image(synthetic_uint16_profile())
+    assert img.shape == (256, 300, 4) and img.dtype == np.uint8
+    assert img[..., 0].min() < 32 and img[..., 0].max() > 224
+
+def test_radargram_image_downsamples_in_chunks():
+    profile = synthetic_uint16_profile(n_samples=100, n_traces=1000)
+    img = gltf.radargram_image(profile, max_size=64, chunk=37)
+    assert img.shape == (64, 64, 4)
+    # chunking only changes float summation order
+    unchunked = gltf.radargram_image(profile, max_size=64, chunk=1000)
+    assert np.abs(img.astype(int) - unchunked.astype(int)).max() <= 1
@@ -0,0 +1,52 @@
+import json
+import struct
+from pathlib import Path
+
+from pdgsubsurface.pipeline import Pipeline, _unique_names
+
+def position_count(b3dm: bytes) -> int:
+    """
+    Number of vertices in the curtain mesh of a b3dm tile.
+    """
+    ft_json_len, = struct.unpack('<I', b3dm[12:16])
+    glb = b3dm[28 + ft_json_len:]
+    json_len, = struct.unpack('<I', glb[12:16])
+    doc = json.loads(glb[20:20 + json_len])
+    return doc['accessors'][doc['meshes'][0]['primitives'][0]['attributes']['POSITION']]['count']
+
+def test_process_uses_per_file_tracks(dzt_factory, tmp_path):
+    files = [dzt_factory('LINE01', n_traces=20),
+             dzt_factory('LINE02', n_traces=30, nchan=2)]
+    p = Pipeline(gpr_files=files, output_dir=tmp_path.joinpath('out'), translate_z=1.0)
+    p.process()
+    assert [position_count(m['b3dm']) for m in p.models] == [40, 60, 60]
+
+def test_save_models_writes_tileset(dzt_factory, tmp_path):
+    out = tmp_path.joinpath('out')
+    files = [dzt_factory('LINE01'), dzt_factory('LINE02', nchan=2)]
+    Pipeline(gpr_files=files, output_dir=out).process()
+    names = ['LINE01_ch0.b3dm', 'LINE02_ch0.b3dm', 'LINE02_ch1.b3dm']
+    assert sorted(p.name for p in out.glob('*.b3dm')) == names
+    tileset = json.loads(out.joinpath('tileset.json').read_text())
+    children = tileset['root']['children']
+    assert [c['content']['uri'] for c in children] == names
+    root = tileset['root']['boundingVolume']['sphere']
+    for c in children:
+        sphere = c['boundingVolume']['sphere']
+        # child spheres lie inside the root sphere
+        gap = sum((a - b) ** 2 for a, b in zip(sphere[:3], root[:3])) ** 0.5
+        assert gap + sphere[3] <= root[3] + 1e-6
+
+def test_duplicate_stems_get_unique_names(dzt_factory, tmp_path):
+    out = tmp_path.joinpath('out')
+    files = [dzt_factory('d1/FILE____001'), dzt_factory('d2/FILE____001'), dzt_factory('LINE01')]
+    Pipeline(gpr_files=files, output_dir=out, archive=True).process()
+    names = ['LINE01_ch0.b3dm', 'd1_FILE____001_ch0.b3dm', 'd2_FILE____001_ch0.b3dm']
+    assert sorted(p.name for p in out.glob('*.b3dm')) == names
+    tileset = json.loads(out.joinpath('tileset.json').read_text())
+    assert sorted(c['content']['uri'] for c in tileset['root']['children']) == names
+    assert len(list(out.joinpath('archive').iterdir())) == 6
+
+def test_unique_names_fall_back_to_position():
+    files = [Path('a/x/LINE'), Path('b/x/line'), Path('c/LINE')]
+    assert _unique_names(files) == ['LINE_0', 'line_1', 'c_LINE']
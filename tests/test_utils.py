@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from pdgsubsurface import utils
+
+def test_extract_depth_info(dzt_factory):
+    f = dzt_factory(nchan=2, range_ns=100.0, epsr=4.0)
+    depths = [d['depth'] for d in utils.extract_depth_info(f)]
+    # two-way travel time at c / sqrt(4)
+    np.testing.assert_allclose(depths, [100e-9 * utils.C / 2 / 2, 200e-9 * utils.C / 2 / 2])
+
+def test_read_dzg(dzt_factory):
+    f = dzt_factory()
+    fixes = utils.read_dzg(f.with_suffix('.DZG'))
+    np.testing.assert_array_equal(fixes['trace'], [0, 10, 19])
+    np.testing.assert_allclose(fixes['lat'], 64 + (51 + np.array([0, 10, 19]) / 1e4) / 60)
+    np.testing.assert_allclose(fixes['lon'], -(147 + 51 / 60))
+    np.testing.assert_allclose(fixes['sep'], 7.5)
+
+def test_extract_location_info_interpolates(dzt_factory):
+    f = dzt_factory(n_traces=20)
+    loc = utils.extract_location_info(f, 20)
+    assert all(len(loc[k]) == 20 for k in ('lat', 'lon', 'alt', 'height'))
+    np.testing.assert_allclose(loc['alt'], 150.0 + np.arange(20) / 10)
+    np.testing.assert_allclose(loc['height'], loc['alt'] + 7.5)
+    assert np.all(np.diff(loc['lat']) > 0)
+
+def test_extract_location_info_needs_dzg(dzt_factory):
+    f = dzt_factory(with_dzg=False)
+    with pytest.raises(FileNotFoundError):
+        utils.extract_location_info(f, 20)
+
+@pytest.mark.parametrize('nchan', [1, 2])
+@pytest.mark.parametrize('bits', [8, 16, 32])
+def test_memmap_dzt_channel_layout(tmp_path, dzt_writer, nchan, bits):
+    f = tmp_path.joinpath('LINE.DZT')
+    data = dzt_writer(f, nchan=nchan, nsamp=16, n_traces=7, bits=bits)
+    h = utils.read_dzt_header(f)
+    assert (h['offset'], h['nchan'], h['nsamp']) == (1024 * nchan, nchan, 16)
+    assert h['dtype'] == data.dtype
+    profiles = utils.memmap_dzt(f)
+    assert len(profiles) == nchan
+    for c, profile in enumerate(profiles):
+        assert isinstance(profile.base, np.memmap)
+        assert profile.shape == (16, 7)
+        np.testing.assert_array_equal(profile, data[:, c, :].T)
+
+def test_memmap_dzt_ignores_partial_trace(tmp_path, dzt_writer):
+    f = tmp_path.joinpath('LINE.DZT')
+    dzt_writer(f, nsamp=16, n_traces=5)
+    with open(f, 'ab') as fa:
+        fa.write(b'\x00' * 10)
+    assert utils.memmap_dzt(f)[0].shape == (16, 5)
+
+def test_memmap_dzt_without_traces(tmp_path, dzt_writer):
+    f = tmp_path.joinpath('LINE.DZT')
+    dzt_writer(f, n_traces=0)
+    with pytest.raises(ValueError):
+        utils.memmap_dzt(f)
+
+@pytest.mark.parametrize('size', [0, 40])
+def test_read_dzt_header_truncated(tmp_path, dzt_writer, size):
+    f = tmp_path.joinpath('LINE.DZT')
+    dzt_writer(f)
+    with open(f, 'r+b') as fw:
+        fw.truncate(size)
+    with pytest.raises(ValueError):
+        utils.read_dzt_header(f)
+
+def test_read_dzt_header_bad_bits(tmp_path, dzt_writer):
+    f = tmp_path.joinpath('LINE.DZT')
+    dzt_writer(f)
+    with open(f, 'r+b') as fw:
+        fw.seek(6)
+        fw.write(b'\x0c\x00')
+    with pytest.raises(ValueError):
+        utils.read_dzt_header(f)
+
+def test_validate_dzt(dzt_factory):
+    utils.validate_dzt(dzt_factory('LINE01'))
+    with pytest.raises(ValueError):
+        utils.validate_dzt(dzt_factory('SHORT', n_traces=1))
+    with pytest.raises(FileNotFoundError):
+        utils.validate_dzt(dzt_factory('NOGPS', with_dzg=False))